@@ -3,7 +3,10 @@ from flask_cors import CORS
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
 from database import db, init_db
-from models import User, RawMaterial, Medicine, Distribution, RetailSale
+from models import User, RawMaterial, Medicine, Distribution, RetailSale, ScanAggregate
+from profiling import init_profiling, PROFILE_HEADER
+from shared_cache import init_cache
+from scan_telemetry import init_scan_telemetry
 import qrcode
 import os
 from datetime import datetime
@@ -11,7 +14,8 @@ import base64
 from io import BytesIO
 import logging
 import traceback
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError, OperationalError, IntegrityError
 
 # Set up logging
 logging.basicConfig(
@@ -34,7 +38,7 @@ ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', 'https://medical-supply-chai
 CORS(app, resources={r"/*": {
     "origins": ALLOWED_ORIGINS,
     "methods": ["GET", "POST", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"]
+    "allow_headers": ["Content-Type", "Authorization", PROFILE_HEADER]
 }})
 
 try:
@@ -47,8 +51,29 @@ except Exception as e:
     logger.error(f"Failed to initialize database: {str(e)}\n{traceback.format_exc()}")
     raise
 
+init_profiling(app)
+cache = init_cache(app)
+scan_buffer = init_scan_telemetry(app)
+
+# Roles never change once a user is registered, so they can be cached longer.
+USER_CACHE_TTL = 300
+
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "https://medical-supply-chain.vercel.app")
 
+def get_cached_user(user_id):
+    def load():
+        user = User.query.get(user_id)
+        return {'email': user.email, 'role': user.role} if user else None
+    return cache.get_or_set(f"user:{user_id}", load, ttl=USER_CACHE_TTL)
+
+def duplicate_user_field(error):
+    # Postgres messages include the duplicate value, so match the constraint, not the text.
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+    if constraint:
+        return 'phone' if constraint == 'user_phone_key' else 'email'
+    # SQLite reports the column, e.g. "UNIQUE constraint failed: user.phone".
+    return 'phone' if str(error.orig).endswith('user.phone') else 'email'
+
 required_credentials = {
     'Manufacturer': {
         'first_name': 'manufacturer',
@@ -114,10 +139,7 @@ def register():
                     return jsonify({'error': f"Invalid {field} for {data['role']}. Must be {expected_value}"}), 400
 
         with app.app_context():
-            if User.query.filter_by(email=data['email']).first():
-                logger.warning(f"Email already exists: {data['email']}")
-                return jsonify({'error': 'Email already exists'}), 400
-
+            # The unique constraints on email and phone reject duplicates, so no pre-check query is needed.
             user = User(
                 first_name=data['first_name'],
                 last_name=data['last_name'],
@@ -131,6 +153,11 @@ def register():
             logger.info(f"User registered successfully: {data['email']}")
             return jsonify({'message': 'User registered successfully'})
 
+    except IntegrityError as e:
+        db.session.rollback()
+        field = duplicate_user_field(e)
+        logger.warning(f"{field.capitalize()} already exists: {data[field]}")
+        return jsonify({'error': f'{field.capitalize()} already exists'}), 400
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error during registration: {str(e)}\n{traceback.format_exc()}")
@@ -156,7 +183,15 @@ def login():
             return jsonify({'error': 'Invalid request: Missing identifier or password'}), 400
 
         with app.app_context():
-            user = User.query.filter((User.email == data['identifier']) | (User.phone == data['identifier'])).first()
+            # Separate equality lookups let every planner use the unique index on email or phone.
+            # Emails are not format-checked at registration, so fall back to the other column.
+            identifier = str(data['identifier'])
+            columns = [User.email, User.phone] if '@' in identifier else [User.phone, User.email]
+            user = None
+            for column in columns:
+                user = User.query.filter(column == identifier).first()
+                if user:
+                    break
             if user and bcrypt.check_password_hash(user.password, data['password']):
                 logger.info(f"User logged in: {user.email}")
                 return jsonify({
@@ -191,9 +226,9 @@ def check_farmer():
             return jsonify({'error': 'Invalid request: Missing user_id'}), 400
 
         with app.app_context():
-            user = User.query.filter_by(id=data['user_id']).first()
-            if user and user.role == 'Farmer':
-                logger.info(f"Farmer access granted: {user.email}")
+            user = get_cached_user(data['user_id'])
+            if user and user['role'] == 'Farmer':
+                logger.info(f"Farmer access granted: {user['email']}")
                 return jsonify({'message': 'Access granted'})
             logger.warning(f"Unauthorized Farmer access for user_id: {data['user_id']}")
             return jsonify({'error': 'Unauthorized: Not a Farmer'}), 403
@@ -219,9 +254,9 @@ def check_manufacturer():
             return jsonify({'error': 'Invalid request: Missing user_id'}), 400
 
         with app.app_context():
-            user = User.query.filter_by(id=data['user_id']).first()
-            if user and user.role == 'Manufacturer':
-                logger.info(f"Manufacturer access granted: {user.email}")
+            user = get_cached_user(data['user_id'])
+            if user and user['role'] == 'Manufacturer':
+                logger.info(f"Manufacturer access granted: {user['email']}")
                 return jsonify({'message': 'Access granted'})
             logger.warning(f"Unauthorized Manufacturer access for user_id: {data['user_id']}")
             return jsonify({'error': 'Unauthorized: Not a Manufacturer'}), 403
@@ -247,9 +282,9 @@ def check_distributor():
             return jsonify({'error': 'Invalid request: Missing user_id'}), 400
 
         with app.app_context():
-            user = User.query.filter_by(id=data['user_id']).first()
-            if user and user.role == 'Distributor':
-                logger.info(f"Distributor access granted: {user.email}")
+            user = get_cached_user(data['user_id'])
+            if user and user['role'] == 'Distributor':
+                logger.info(f"Distributor access granted: {user['email']}")
                 return jsonify({'message': 'Access granted'})
             logger.warning(f"Unauthorized Distributor access for user_id: {data['user_id']}")
             return jsonify({'error': 'Unauthorized: Not a Distributor'}), 403
@@ -275,9 +310,9 @@ def check_retailer():
             return jsonify({'error': 'Invalid request: Missing user_id'}), 400
 
         with app.app_context():
-            user = User.query.filter_by(id=data['user_id']).first()
-            if user and user.role == 'Retailer':
-                logger.info(f"Retailer access granted: {user.email}")
+            user = get_cached_user(data['user_id'])
+            if user and user['role'] == 'Retailer':
+                logger.info(f"Retailer access granted: {user['email']}")
                 return jsonify({'message': 'Access granted'})
             logger.warning(f"Unauthorized Retailer access for user_id: {data['user_id']}")
             return jsonify({'error': 'Unauthorized: Not a Retailer'}), 403
@@ -311,8 +346,8 @@ def add_raw_material():
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
         with app.app_context():
-            user = User.query.get(data['user_id'])
-            if not user or user.role != 'Farmer':
+            user = get_cached_user(data['user_id'])
+            if not user or user['role'] != 'Farmer':
                 logger.warning(f"Unauthorized: User {data['user_id']} is not a Farmer")
                 return jsonify({'error': 'Unauthorized: Only Farmers can add raw materials'}), 403
 
@@ -325,6 +360,7 @@ def add_raw_material():
             )
             db.session.add(raw_material)
             db.session.commit()
+            cache.invalidate('raw_materials', f"product_history:{raw_material.id}")
 
             logger.info(f"Raw material added: ID {raw_material.id}")
             return jsonify({
@@ -352,14 +388,18 @@ def get_raw_materials():
 
     try:
         with app.app_context():
-            used_raw_material_ids = db.session.query(Medicine.raw_material_id).distinct().subquery()
-            materials = RawMaterial.query.filter(~RawMaterial.id.in_(used_raw_material_ids)).all()
+            def load():
+                used = db.session.query(Medicine.id).filter(Medicine.raw_material_id == RawMaterial.id).exists()
+                materials = RawMaterial.query.filter(~used).all()
+                return [{
+                    'id': m.id,
+                    'material_type': m.material_type,
+                    'quantity': m.quantity
+                } for m in materials]
+
+            materials = cache.get_or_set('raw_materials', load)
             logger.info(f"Fetched {len(materials)} available raw materials")
-            return jsonify([{
-                'id': m.id,
-                'material_type': m.material_type,
-                'quantity': m.quantity
-            } for m in materials])
+            return jsonify(materials)
 
     except Exception as e:
         logger.error(f"Error in get_raw_materials: {str(e)}\n{traceback.format_exc()}")
@@ -377,14 +417,18 @@ def get_medicines():
 
     try:
         with app.app_context():
-            used_medicine_ids = db.session.query(Distribution.medicine_id).distinct().subquery()
-            medicines = Medicine.query.filter(~Medicine.id.in_(used_medicine_ids)).all()
+            def load():
+                used = db.session.query(Distribution.id).filter(Distribution.medicine_id == Medicine.id).exists()
+                medicines = Medicine.query.filter(~used).all()
+                return [{
+                    'id': m.id,
+                    'medicine_name': m.medicine_name,
+                    'batch_number': m.batch_number
+                } for m in medicines]
+
+            medicines = cache.get_or_set('medicines', load)
             logger.info(f"Fetched {len(medicines)} available medicines")
-            return jsonify([{
-                'id': m.id,
-                'medicine_name': m.medicine_name,
-                'batch_number': m.batch_number
-            } for m in medicines])
+            return jsonify(medicines)
 
     except Exception as e:
         logger.error(f"Error in get_medicines: {str(e)}\n{traceback.format_exc()}")
@@ -416,8 +460,8 @@ def add_medicine():
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
         with app.app_context():
-            user = User.query.get(data['user_id'])
-            if not user or user.role != 'Manufacturer':
+            user = get_cached_user(data['user_id'])
+            if not user or user['role'] != 'Manufacturer':
                 logger.warning(f"Unauthorized: User {data['user_id']} is not a Manufacturer")
                 return jsonify({'error': 'Unauthorized: Only Manufacturers can add medicines'}), 403
 
@@ -431,6 +475,7 @@ def add_medicine():
             )
             db.session.add(medicine)
             db.session.commit()
+            cache.invalidate('raw_materials', 'medicines', f"product_history:{medicine.id}")
 
             logger.info(f"Medicine added: ID {medicine.id}")
             return jsonify({
@@ -438,6 +483,10 @@ def add_medicine():
                 'message': 'Medicine added successfully'
             })
 
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.warning(f"Constraint violation in add_medicine: {str(e.orig)}")
+        return jsonify({'error': 'Invalid request: referenced record does not exist'}), 400
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error in add_medicine: {str(e)}\n{traceback.format_exc()}")
@@ -458,15 +507,19 @@ def get_distributions():
 
     try:
         with app.app_context():
-            used_distribution_ids = db.session.query(RetailSale.distribution_id).distinct().subquery()
-            distributions = Distribution.query.filter(~Distribution.id.in_(used_distribution_ids)).all()
+            def load():
+                used = db.session.query(RetailSale.id).filter(RetailSale.distribution_id == Distribution.id).exists()
+                distributions = Distribution.query.filter(~used).all()
+                return [{
+                    'id': d.id,
+                    'medicine_id': d.medicine_id,
+                    'destination': d.destination,
+                    'shipment_date': d.shipment_date.strftime('%Y-%m-%d')
+                } for d in distributions]
+
+            distributions = cache.get_or_set('distributions', load)
             logger.info(f"Fetched {len(distributions)} available distributions")
-            return jsonify([{
-                'id': d.id,
-                'medicine_id': d.medicine_id,
-                'destination': d.destination,
-                'shipment_date': d.shipment_date.strftime('%Y-%m-%d')
-            } for d in distributions])
+            return jsonify(distributions)
 
     except Exception as e:
         logger.error(f"Error in get_distributions: {str(e)}\n{traceback.format_exc()}")
@@ -497,8 +550,8 @@ def add_distribution():
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
         with app.app_context():
-            user = User.query.get(data['user_id'])
-            if not user or user.role != 'Distributor':
+            user = get_cached_user(data['user_id'])
+            if not user or user['role'] != 'Distributor':
                 logger.warning(f"Unauthorized: User {data['user_id']} is not a Distributor")
                 return jsonify({'error': 'Unauthorized: Only Distributors can add distributions'}), 403
 
@@ -512,6 +565,7 @@ def add_distribution():
             )
             db.session.add(distribution)
             db.session.commit()
+            cache.invalidate('medicines', 'distributions', f"product_history:{distribution.medicine_id}")
 
             logger.info(f"Distribution added: ID {distribution.id}")
             return jsonify({
@@ -519,6 +573,10 @@ def add_distribution():
                 'message': 'Distribution added successfully'
             })
 
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.warning(f"Constraint violation in add_distribution: {str(e.orig)}")
+        return jsonify({'error': 'Invalid request: referenced record does not exist'}), 400
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error in add_distribution: {str(e)}\n{traceback.format_exc()}")
@@ -552,8 +610,8 @@ def add_retail():
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
         with app.app_context():
-            user = User.query.get(data['user_id'])
-            if not user or user.role != 'Retailer':
+            user = get_cached_user(data['user_id'])
+            if not user or user['role'] != 'Retailer':
                 logger.warning(f"Unauthorized: User {data['user_id']} is not a Retailer")
                 return jsonify({'error': 'Unauthorized: Only Retailers can add retail sales'}), 403
 
@@ -581,6 +639,7 @@ def add_retail():
             img_str = base64.b64encode(buffered.getvalue()).decode()
             retail.qr_code = f"data:image/png;base64,{img_str}"
             db.session.commit()
+            cache.invalidate('distributions', f"product_history:{medicine_id}")
 
             logger.info(f"Retail sale added: ID {retail.id}")
             return jsonify({
@@ -589,6 +648,10 @@ def add_retail():
                 'qr_code': retail.qr_code
             })
 
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.warning(f"Constraint violation in add_retail: {str(e.orig)}")
+        return jsonify({'error': 'Invalid request: referenced record does not exist'}), 400
     except SQLAlchemyError as e:
         db.session.rollback()
         logger.error(f"Database error in add_retail: {str(e)}\n{traceback.format_exc()}")
@@ -610,58 +673,110 @@ def get_product_history(id):
     try:
         logger.info(f"Fetching product history for ID: {id}")
         with app.app_context():
-            medicine = Medicine.query.get(id)
-            if medicine:
-                raw_material = RawMaterial.query.get(medicine.raw_material_id)
-                distributions = Distribution.query.filter_by(medicine_id=medicine.id).all()
-                retail_sales = RetailSale.query.filter(RetailSale.distribution_id.in_([d.id for d in distributions])).all()
+            def load():
+                medicine = Medicine.query.get(id)
+                if medicine:
+                    raw_material = RawMaterial.query.get(medicine.raw_material_id)
+                    distributions = Distribution.query.filter_by(medicine_id=medicine.id).all()
+                    retail_sales = RetailSale.query.filter(RetailSale.distribution_id.in_([d.id for d in distributions])).all()
+
+                    return {
+                        'raw_material': {
+                            'material_type': raw_material.material_type,
+                            'quantity': raw_material.quantity,
+                            'source_location': raw_material.source_location,
+                            'supply_date': raw_material.supply_date.strftime('%Y-%m-%d')
+                        } if raw_material else None,
+                        'medicine': {
+                            'medicine_name': medicine.medicine_name,
+                            'batch_number': medicine.batch_number,
+                            'production_date': medicine.production_date.strftime('%Y-%m-%d'),
+                            'expiry_date': medicine.expiry_date.strftime('%Y-%m-%d')
+                        },
+                        'distributions': [{
+                            'shipment_date': d.shipment_date.strftime('%Y-%m-%d'),
+                            'transport_method': d.transport_method,
+                            'destination': d.destination,
+                            'storage_condition': d.storage_condition
+                        } for d in distributions],
+                        'retail_sales': [{
+                            'received_date': r.received_date.strftime('%Y-%m-%d'),
+                            'price': r.price,
+                            'retail_location': r.retail_location,
+                            'qr_code': r.qr_code
+                        } for r in retail_sales]
+                    }
+
+                raw_material = RawMaterial.query.get(id)
+                if raw_material:
+                    return {
+                        'raw_material': {
+                            'material_type': raw_material.material_type,
+                            'quantity': raw_material.quantity,
+                            'source_location': raw_material.source_location,
+                            'supply_date': raw_material.supply_date.strftime('%Y-%m-%d')
+                        },
+                        'medicine': None,
+                        'distributions': [],
+                        'retail_sales': []
+                    }
+
+                return None
+
+            history = cache.get_or_set(f"product_history:{id}", load)
+            if history is None:
+                logger.warning(f"Record not found for ID: {id}")
+                return jsonify({'error': 'Record not found'}), 404
+
+            if history['medicine']:
+                scan_buffer.record(id, request.args.get('location'))
+            return jsonify(history)
 
-                return jsonify({
-                    'raw_material': {
-                        'material_type': raw_material.material_type,
-                        'quantity': raw_material.quantity,
-                        'source_location': raw_material.source_location,
-                        'supply_date': raw_material.supply_date.strftime('%Y-%m-%d')
-                    } if raw_material else None,
-                    'medicine': {
-                        'medicine_name': medicine.medicine_name,
-                        'batch_number': medicine.batch_number,
-                        'production_date': medicine.production_date.strftime('%Y-%m-%d'),
-                        'expiry_date': medicine.expiry_date.strftime('%Y-%m-%d')
-                    },
-                    'distributions': [{
-                        'shipment_date': d.shipment_date.strftime('%Y-%m-%d'),
-                        'transport_method': d.transport_method,
-                        'destination': d.destination,
-                        'storage_condition': d.storage_condition
-                    } for d in distributions],
-                    'retail_sales': [{
-                        'received_date': r.received_date.strftime('%Y-%m-%d'),
-                        'price': r.price,
-                        'retail_location': r.retail_location,
-                        'qr_code': r.qr_code
-                    } for r in retail_sales]
-                })
+    except Exception as e:
+        logger.error(f"Error in get_product_history: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
-            raw_material = RawMaterial.query.get(id)
-            if raw_material:
-                return jsonify({
-                    'raw_material': {
-                        'material_type': raw_material.material_type,
-                        'quantity': raw_material.quantity,
-                        'source_location': raw_material.source_location,
-                        'supply_date': raw_material.supply_date.strftime('%Y-%m-%d')
-                    },
-                    'medicine': None,
-                    'distributions': [],
-                    'retail_sales': []
-                })
+@app.route('/scan_stats/<int:medicine_id>', methods=['GET', 'OPTIONS'])
+def get_scan_stats(medicine_id):
+    if request.method == 'OPTIONS':
+        logger.info("Handling OPTIONS request for /scan_stats")
+        response = jsonify({'message': 'Preflight OK'})
+        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin'))
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        return response
 
-            logger.warning(f"Record not found for ID: {id}")
-            return jsonify({'error': 'Record not found'}), 404
+    try:
+        with app.app_context():
+            locations = db.session.query(
+                ScanAggregate.location,
+                func.sum(ScanAggregate.scan_count),
+                func.min(ScanAggregate.first_scanned_at),
+                func.max(ScanAggregate.last_scanned_at)
+            ).filter(ScanAggregate.medicine_id == medicine_id).group_by(ScanAggregate.location).all()
+            daily = ScanAggregate.query.filter_by(medicine_id=medicine_id).order_by(
+                ScanAggregate.scan_date, ScanAggregate.location
+            ).all()
+
+            logger.info(f"Fetched scan stats for medicine {medicine_id}: {len(locations)} locations")
+            return jsonify({
+                'medicine_id': medicine_id,
+                'total_scans': sum(count for _, count, _, _ in locations),
+                'locations': [{
+                    'location': location,
+                    'scan_count': count,
+                    'first_scanned_at': first.isoformat(),
+                    'last_scanned_at': last.isoformat()
+                } for location, count, first, last in locations],
+                'daily': [{
+                    'scan_date': s.scan_date.strftime('%Y-%m-%d'),
+                    'location': s.location,
+                    'scan_count': s.scan_count
+                } for s in daily]
+            })
 
     except Exception as e:
-        logger.error(f"Error in get_product_history: {str(e)}\n{traceback.format_exc()}")
+        logger.error(f"Error in get_scan_stats: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
 if __name__ == "__main__":
@@ -1,11 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 import logging
 
 db = SQLAlchemy()
 logger = logging.getLogger(__name__)
 
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys unless asked, and the write paths rely on them.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
 def init_db(app):
     db.init_app(app)
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _enable_sqlite_foreign_keys)
         db.create_all()
         logger.info("Database tables created or already exist")
\ No newline at end of file
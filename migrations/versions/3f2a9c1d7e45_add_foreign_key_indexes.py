@@ -0,0 +1,49 @@
+"""add foreign key indexes
+
+Revision ID: 3f2a9c1d7e45
+Revises: 
+Create Date: 2026-10-19 03:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e45'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Tables are created by db.create_all() on startup, which adds these indexes
+# for new databases but not for tables that already existed.
+INDEXES = [
+    ('ix_raw_material_user_id', 'raw_material', ['user_id']),
+    ('ix_medicine_user_id', 'medicine', ['user_id']),
+    ('ix_medicine_raw_material_id', 'medicine', ['raw_material_id']),
+    ('ix_distribution_user_id', 'distribution', ['user_id']),
+    ('ix_distribution_medicine_id', 'distribution', ['medicine_id']),
+    ('ix_retail_sale_user_id', 'retail_sale', ['user_id']),
+    ('ix_retail_sale_distribution_id', 'retail_sale', ['distribution_id']),
+    ('ix_scan_aggregate_medicine_id_scan_date_location', 'scan_aggregate', ['medicine_id', 'scan_date', 'location']),
+]
+
+
+def _existing_indexes():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    return tables, {(table, index['name']) for table in tables for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    tables, existing = _existing_indexes()
+    for name, table, columns in INDEXES:
+        if table in tables and (table, name) not in existing:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    tables, existing = _existing_indexes()
+    for name, table, columns in reversed(INDEXES):
+        if (table, name) in existing:
+            op.drop_index(name, table_name=table)
@@ -12,7 +12,7 @@ class User(db.Model):
 
 class RawMaterial(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     material_type = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     source_location = db.Column(db.String(100), nullable=False)
@@ -21,8 +21,8 @@ class RawMaterial(db.Model):
 
 class Medicine(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    raw_material_id = db.Column(db.Integer, db.ForeignKey('raw_material.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    raw_material_id = db.Column(db.Integer, db.ForeignKey('raw_material.id'), nullable=False, index=True)
     medicine_name = db.Column(db.String(100), nullable=False)
     batch_number = db.Column(db.String(50), nullable=False)
     production_date = db.Column(db.Date, nullable=False)
@@ -32,8 +32,8 @@ class Medicine(db.Model):
 
 class Distribution(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False, index=True)
     shipment_date = db.Column(db.Date, nullable=False)
     transport_method = db.Column(db.String(100), nullable=False)
     destination = db.Column(db.String(100), nullable=False)
@@ -43,11 +43,25 @@ class Distribution(db.Model):
 
 class RetailSale(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    distribution_id = db.Column(db.Integer, db.ForeignKey('distribution.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    distribution_id = db.Column(db.Integer, db.ForeignKey('distribution.id'), nullable=False, index=True)
     received_date = db.Column(db.Date, nullable=False)
     price = db.Column(db.Float, nullable=False)
     retail_location = db.Column(db.String(100), nullable=False)
     qr_code = db.Column(db.Text, nullable=True)  # Only RetailSale has qr_code
     user = db.relationship('User', backref='retail_sales')
-    distribution = db.relationship('Distribution', backref='retail_sales')
\ No newline at end of file
+    distribution = db.relationship('Distribution', backref='retail_sales')
+
+class ScanAggregate(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('medicine_id', 'location', 'scan_date', name='uq_scan_aggregate_medicine_location_date'),
+        db.Index('ix_scan_aggregate_medicine_id_scan_date_location', 'medicine_id', 'scan_date', 'location'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicine.id'), nullable=False)
+    location = db.Column(db.String(100), nullable=False)
+    scan_date = db.Column(db.Date, nullable=False)
+    scan_count = db.Column(db.Integer, nullable=False, default=0)
+    first_scanned_at = db.Column(db.DateTime, nullable=False)
+    last_scanned_at = db.Column(db.DateTime, nullable=False)
+    medicine = db.relationship('Medicine', backref='scan_aggregates')
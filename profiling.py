@@ -0,0 +1,176 @@
+from flask import g, request
+from collections import Counter
+from datetime import datetime
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile-Token'
+
+# Phases are matched against the innermost frame whose file lives in one of
+# these packages, so a SQL call issued through the ORM counts as 'sql'.
+PHASES = [
+    ('sql', ('/sqlalchemy/engine/', '/sqlalchemy/pool/', '/sqlalchemy/dialects/', '/psycopg2/', '/sqlite3/')),
+    ('orm', ('/sqlalchemy/orm/', '/flask_sqlalchemy/')),
+    ('qr', ('/qrcode/', '/PIL/')),
+    ('bcrypt', ('/bcrypt/', '/flask_bcrypt.py')),
+    ('json', ('/json/',)),
+]
+
+
+class _StackSampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.phases = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            self.phases[_classify(frames)] += 1
+            self.stacks[';'.join(_frame_label(f) for f in reversed(frames))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _classify(frames):
+    for frame in frames:
+        filename = frame.f_code.co_filename.replace(os.sep, '/')
+        for phase, markers in PHASES:
+            if any(marker in filename for marker in markers):
+                return phase
+    return 'app'
+
+
+def init_profiling(app):
+    token = os.environ.get('PROFILE_TOKEN')
+    sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    if not token and sample_rate <= 0:
+        # Nothing is registered, so disabled profiling costs nothing per request.
+        logger.info("Request profiling disabled")
+        return
+
+    interval = float(os.environ.get('PROFILE_INTERVAL_MS', '1')) / 1000
+    output_dir = os.environ.get('PROFILE_DIR', 'profiles')
+    max_profiles = int(os.environ.get('PROFILE_MAX_FILES', '200'))
+    os.makedirs(output_dir, exist_ok=True)
+
+    def should_profile():
+        header = request.headers.get(PROFILE_HEADER)
+        # compare_digest rejects non-ASCII str, so compare the encoded bytes.
+        if token and header and hmac.compare_digest(header.encode(), token.encode()):
+            return True
+        return sample_rate > 0 and random.random() < sample_rate
+
+    @app.before_request
+    def start_profiler():
+        if request.method == 'OPTIONS' or not should_profile():
+            return
+        sampler = _StackSampler(threading.get_ident(), interval)
+        g.profile_sampler = sampler
+        g.profile_started = time.perf_counter()
+        sampler.start()
+
+    @app.after_request
+    def write_profile(response):
+        sampler = g.pop('profile_sampler', None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        wall_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+        try:
+            _write_profile(output_dir, sampler, wall_ms, response.status_code)
+            _prune_profiles(output_dir, max_profiles)
+        except OSError as e:
+            logger.error(f"Failed to write request profile: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        sampler = g.pop('profile_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+    logger.info(f"Request profiling enabled: sample_rate={sample_rate}, token={'set' if token else 'unset'}, dir={output_dir}, max_profiles={max_profiles}")
+
+
+def _write_profile(output_dir, sampler, wall_ms, status_code):
+    endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unknown')
+    name = f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{os.getpid()}-{endpoint}"
+    total = sum(sampler.phases.values())
+
+    with open(os.path.join(output_dir, f"{name}.folded"), 'w') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    summary = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': status_code,
+        'wall_ms': round(wall_ms, 3),
+        # The sampler has to win the GIL, so it fires less often than PROFILE_INTERVAL_MS asks
+        # and phase times are apportioned from wall time rather than counted in intervals.
+        'samples_per_second': round(1000.0 * total / wall_ms, 1) if wall_ms else 0,
+        'samples': total,
+        'phases': {
+            phase: {
+                'samples': count,
+                'ms': round(wall_ms * count / total, 3),
+                'percent': round(100.0 * count / total, 1)
+            } for phase, count in sampler.phases.most_common()
+        }
+    }
+    with open(os.path.join(output_dir, f"{name}.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    breakdown = ', '.join(f"{phase}={data['percent']}%" for phase, data in summary['phases'].items())
+    logger.info(f"Profiled {request.method} {request.path} in {wall_ms:.1f}ms ({total} samples): {breakdown or 'no samples'} -> {name}")
+
+
+def _prune_profiles(output_dir, max_profiles):
+    # Sampling mode runs unattended, so keep only the newest profiles (a .folded/.json pair each).
+    profiles = {}
+    for entry in os.scandir(output_dir):
+        name, ext = os.path.splitext(entry.name)
+        if ext in ('.folded', '.json'):
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                # Another worker pruned it first.
+                continue
+            paths, newest = profiles.get(name, ([], 0))
+            profiles[name] = (paths + [entry.path], max(newest, mtime))
+    if len(profiles) <= max_profiles:
+        return
+    by_age = sorted(profiles.values(), key=lambda profile: profile[1])
+    for paths, _ in by_age[:len(profiles) - max_profiles]:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,210 @@
+from database import db
+from models import ScanAggregate
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+import atexit
+import logging
+import os
+import re
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+UPSERT_CHUNK_SIZE = 500
+UNKNOWN_LOCATION = 'unknown'
+# Scans from locations past the per-medicine cap, or arriving while the buffer is
+# full, are counted here instead of creating new aggregate rows.
+OVERFLOW_LOCATION = 'other'
+
+
+# Aggregates consumer scans in memory and writes them as batched upserts from a
+# background thread. At most flush_size scans or flush_interval seconds of scans
+# per worker are lost on a hard crash; graceful shutdown flushes via atexit.
+class ScanBuffer:
+    def __init__(self, app, flush_size=500, flush_interval=10.0, max_pending=10000, max_locations=50):
+        self.app = app
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_locations = max_locations
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush)
+
+    def _reset(self):
+        # A forked worker must not inherit the parent's counts, lock state or thread.
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._events = 0
+        self._thread = None
+        self._day = None
+        self._locations = {}
+        self.dropped = 0
+
+    def record(self, medicine_id, location):
+        now = datetime.utcnow()
+        day = now.date()
+        location = normalize_location(location)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='scan-telemetry', daemon=True)
+                self._thread.start()
+
+            # Locations are client-supplied, so each medicine gets a bounded set per day.
+            if self._day != day:
+                self._day = day
+                self._locations = {}
+            seen = self._locations.setdefault(medicine_id, set())
+            if location not in seen:
+                if len(seen) >= self.max_locations:
+                    location = OVERFLOW_LOCATION
+                else:
+                    seen.add(location)
+
+            key = (medicine_id, location, day)
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                # Existing keys keep counting; new ones fold into the overflow bucket until the next flush.
+                self._wakeup.set()
+                key = (medicine_id, OVERFLOW_LOCATION, day)
+            if not self._merge(key, 1, now, now):
+                return
+            self._events += 1
+            if self._events >= self.flush_size:
+                self._wakeup.set()
+
+    def _merge(self, key, count, first, last):
+        entry = self._pending.get(key)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += count
+                return False
+            self._pending[key] = [count, first, last]
+        else:
+            entry[0] += count
+            entry[1] = min(entry[1], first)
+            entry[2] = max(entry[2], last)
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # The thread must outlive a bad batch, or this worker stops persisting scans.
+                logger.error(f"Unexpected error flushing scan telemetry: {str(e)}\n{traceback.format_exc()}")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            dropped, self.dropped = self.dropped, 0
+            self._events = 0
+        if dropped:
+            logger.warning(f"Scan telemetry buffer full, dropped {dropped} scans")
+        if not pending:
+            return
+
+        rows = [{
+            'medicine_id': medicine_id,
+            'location': location,
+            'scan_date': scan_date,
+            'scan_count': count,
+            'first_scanned_at': first,
+            'last_scanned_at': last
+        } for (medicine_id, location, scan_date), (count, first, last) in pending.items()]
+
+        with self.app.app_context():
+            try:
+                for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+                    _upsert(rows[i:i + UPSERT_CHUNK_SIZE])
+                db.session.commit()
+                logger.info(f"Flushed {sum(r['scan_count'] for r in rows)} scans into {len(rows)} aggregates")
+            except IntegrityError as e:
+                # Retrying the whole batch would fail forever, so isolate the rows the database rejects.
+                db.session.rollback()
+                logger.warning(f"Scan telemetry batch violated a constraint, flushing rows individually: {str(e.orig)}")
+                self._flush_individually(rows)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Failed to flush scan telemetry, requeueing {len(rows)} aggregates: {str(e)}")
+                self._requeue(rows)
+
+    def _flush_individually(self, rows):
+        failed = []
+        for row in rows:
+            try:
+                _upsert([row])
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                logger.error(f"Discarding {row['scan_count']} scans for medicine {row['medicine_id']}: {str(e.orig)}")
+            except SQLAlchemyError:
+                db.session.rollback()
+                failed.append(row)
+        if failed:
+            logger.error(f"Failed to flush scan telemetry, requeueing {len(failed)} aggregates")
+            self._requeue(failed)
+
+    def _requeue(self, rows):
+        with self._lock:
+            for row in rows:
+                key = (row['medicine_id'], row['location'], row['scan_date'])
+                self._merge(key, row['scan_count'], row['first_scanned_at'], row['last_scanned_at'])
+
+
+def normalize_location(value):
+    value = re.sub(r'[^\w ,.-]', '', (value or '').lower())
+    value = ' '.join(value.split())[:64]
+    return value or UNKNOWN_LOCATION
+
+
+def _upsert(rows):
+    table = ScanAggregate.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        earliest, latest = func.least, func.greatest
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        # SQLite's min()/max() are scalar functions when given two arguments.
+        earliest, latest = func.min, func.max
+    else:
+        for row in rows:
+            aggregate = ScanAggregate.query.filter_by(
+                medicine_id=row['medicine_id'], location=row['location'], scan_date=row['scan_date']
+            ).first()
+            if aggregate:
+                aggregate.scan_count += row['scan_count']
+                aggregate.first_scanned_at = min(aggregate.first_scanned_at, row['first_scanned_at'])
+                aggregate.last_scanned_at = max(aggregate.last_scanned_at, row['last_scanned_at'])
+            else:
+                db.session.add(ScanAggregate(**row))
+        return
+
+    stmt = insert(table).values(rows)
+    # Workers flush on their own schedules, so an older batch may land after a newer one.
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.medicine_id, table.c.location, table.c.scan_date],
+        set_={
+            'scan_count': table.c.scan_count + stmt.excluded.scan_count,
+            'first_scanned_at': earliest(table.c.first_scanned_at, stmt.excluded.first_scanned_at),
+            'last_scanned_at': latest(table.c.last_scanned_at, stmt.excluded.last_scanned_at)
+        }
+    )
+    db.session.execute(stmt)
+
+
+def init_scan_telemetry(app):
+    buffer = ScanBuffer(
+        app,
+        flush_size=int(os.environ.get('SCAN_FLUSH_SIZE', '500')),
+        flush_interval=float(os.environ.get('SCAN_FLUSH_INTERVAL', '10')),
+        max_pending=int(os.environ.get('SCAN_MAX_PENDING', '10000')),
+        max_locations=int(os.environ.get('SCAN_MAX_LOCATIONS', '50'))
+    )
+    logger.info(f"Scan telemetry buffering up to {buffer.flush_size} scans or {buffer.flush_interval}s per flush")
+    return buffer
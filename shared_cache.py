@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Invalidations are remembered this long so that a refill whose load started before
+# one cannot store data read before the write; slower loads are never stored.
+INVALIDATION_WINDOW = 300
+
+
+# Key-value cache in a local SQLite file, shared by every worker process on the host.
+class SharedCache:
+    def __init__(self, path, namespace='', max_entries=10000, default_ttl=30):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+
+    def _connect(self):
+        # SQLite connections must not cross a fork, so each process (and thread) opens its own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS invalidations ('
+            'key TEXT PRIMARY KEY, invalidated_at REAL NOT NULL)'
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key, default=None):
+        try:
+            row = self._connect().execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (self._key(key), time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed for {key}: {str(e)}")
+            return default
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl=None, loaded_since=None):
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        try:
+            conn = self._connect()
+            if loaded_since is None:
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (self._key(key), json.dumps(value), expires_at)
+                )
+            elif now - loaded_since <= INVALIDATION_WINDOW:
+                # Checked and written in one statement, so an invalidation cannot slip in between.
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, expires_at) SELECT ?, ?, ? '
+                    'WHERE NOT EXISTS (SELECT 1 FROM invalidations WHERE key = ? AND invalidated_at >= ?)',
+                    (self._key(key), json.dumps(value), expires_at, self._key(key), loaded_since)
+                )
+            self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed for {key}: {str(e)}")
+
+    def get_or_set(self, key, loader, ttl=None):
+        started = time.time()
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl, loaded_since=started)
+        return value
+
+    def invalidate(self, *keys):
+        if not keys:
+            return
+        now = time.time()
+        keys = [self._key(k) for k in keys]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany('DELETE FROM cache WHERE key = ?', [(k,) for k in keys])
+                conn.executemany(
+                    'INSERT OR REPLACE INTO invalidations (key, invalidated_at) VALUES (?, ?)',
+                    [(k, now) for k in keys]
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache invalidation failed for {keys}: {str(e)}")
+
+    def clear(self):
+        try:
+            self._connect().execute('DELETE FROM cache WHERE key LIKE ?', (f"{self.namespace}:%",))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache clear failed: {str(e)}")
+
+    def _evict(self, conn):
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        conn.execute('DELETE FROM invalidations WHERE invalidated_at < ?', (time.time() - INVALIDATION_WINDOW,))
+        overflow = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+        if overflow > 0:
+            # Entries closest to expiry are the least valuable to keep.
+            conn.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)',
+                (overflow,)
+            )
+
+
+class NullCache:
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None, loaded_since=None):
+        pass
+
+    def get_or_set(self, key, loader, ttl=None):
+        return loader()
+
+    def invalidate(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _private_cache_dir():
+    # Cached roles are trusted for authorization, so the default location must not be
+    # writable by other local users: a 0700 directory owned by the current user.
+    path = os.path.join(tempfile.gettempdir(), f"supply_chain_cache-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory owned by the current user")
+    return path
+
+
+def init_cache(app):
+    if os.environ.get('SHARED_CACHE_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        logger.info("Shared cache disabled")
+        return NullCache()
+
+    path = os.environ.get('SHARED_CACHE_PATH')
+    if not path:
+        try:
+            path = os.path.join(_private_cache_dir(), 'cache.sqlite3')
+        except OSError as e:
+            logger.error(f"Shared cache disabled, no safe default location: {str(e)}")
+            return NullCache()
+
+    # Keys are scoped to the database so apps on the same host never share entries.
+    namespace = hashlib.sha256(app.config['SQLALCHEMY_DATABASE_URI'].encode()).hexdigest()[:16]
+    cache = SharedCache(
+        path,
+        namespace=namespace,
+        max_entries=int(os.environ.get('SHARED_CACHE_MAX_ENTRIES', '10000')),
+        default_ttl=float(os.environ.get('SHARED_CACHE_TTL', '30'))
+    )
+    logger.info(f"Shared cache enabled at {path}")
+    return cache
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# app.py configures itself from the environment at import time, so every test module
+# shares one temporary database and cache file set up before the first import.
+_tmpdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmpdir, 'test.db')}"
+os.environ['SHARED_CACHE_ENABLED'] = 'true'
+os.environ['SHARED_CACHE_PATH'] = os.path.join(_tmpdir, 'cache.sqlite3')
+os.environ.pop('PROFILE_TOKEN', None)
+os.environ.pop('PROFILE_SAMPLE_RATE', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from flask import Flask
+
+from profiling import PROFILE_HEADER, init_profiling
+
+
+def _make_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+    monkeypatch.delenv('PROFILE_SAMPLE_RATE', raising=False)
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path))
+    app = Flask(__name__)
+
+    @app.route('/ping')
+    def ping():
+        return 'ok'
+
+    init_profiling(app)
+    return app, tmp_path
+
+
+@pytest.fixture
+def profiled_app(tmp_path, monkeypatch):
+    return _make_app(tmp_path, monkeypatch)
+
+
+def _profile_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(('.json', '.folded')))
+
+
+def test_valid_token_writes_profile(profiled_app):
+    app, directory = profiled_app
+    response = app.test_client().get('/ping', headers={PROFILE_HEADER: 'secret'})
+    assert response.status_code == 200
+    assert [name.rsplit('.', 1)[1] for name in _profile_files(directory)] == ['folded', 'json']
+
+
+@pytest.mark.parametrize('token', ['wrong', 'sécret'])
+def test_wrong_or_non_ascii_token_is_ignored(profiled_app, token):
+    app, directory = profiled_app
+    response = app.test_client().get('/ping', headers={PROFILE_HEADER: token})
+    assert response.status_code == 200
+    assert _profile_files(directory) == []
+
+
+def test_old_profiles_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILE_MAX_FILES', '2')
+    app, directory = _make_app(tmp_path, monkeypatch)
+
+    client = app.test_client()
+    for _ in range(5):
+        assert client.get('/ping', headers={PROFILE_HEADER: 'secret'}).status_code == 200
+    assert len(_profile_files(directory)) == 4
@@ -0,0 +1,129 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+import app as app_module
+from database import db
+from shared_cache import NullCache
+
+PASSWORD = '12345678'
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?!\w)(?! USING (COVERING )?INDEX)')
+# These routes return every row of their table that has not been consumed yet, so
+# reading that table in full is the plan; the NOT EXISTS probe must still use an index.
+LISTING_SCANS = {
+    'get_raw_materials': 'raw_material',
+    'get_medicines': 'medicine',
+    'get_distributions': 'distribution',
+}
+
+
+@pytest.fixture(scope='module')
+def statements():
+    captured = []
+    current_endpoint = [None]
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT')):
+            captured.append((current_endpoint[0], statement, parameters))
+
+    with app_module.app.app_context():
+        engine = db.engine
+    # Every route has to reach the database, so cached reads are switched off here.
+    cache, app_module.cache = app_module.cache, NullCache()
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        _exercise_routes(_EndpointTrackingClient(app_module.app, current_endpoint))
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+        app_module.cache = cache
+    return engine, captured
+
+
+class _EndpointTrackingClient:
+    def __init__(self, app, current_endpoint):
+        self.client = app.test_client()
+        self.urls = app.url_map.bind('localhost')
+        self.current_endpoint = current_endpoint
+
+    def _track(self, method, path):
+        self.current_endpoint[0] = self.urls.match(path.split('?')[0], method)[0]
+
+    def get(self, path, **kwargs):
+        self._track('GET', path)
+        return self.client.get(path, **kwargs)
+
+    def post(self, path, **kwargs):
+        self._track('POST', path)
+        return self.client.post(path, **kwargs)
+
+
+def _exercise_routes(client):
+    def register(role, email, phone, first_name, last_name):
+        response = client.post('/register', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'phone': phone,
+            'password': PASSWORD, 'confirm_password': PASSWORD, 'role': role
+        })
+        assert response.status_code == 200, response.get_json()
+
+    register('Farmer', 'farmer@example.com', '1111111111', 'farmer', 'farmer')
+    for role, creds in app_module.required_credentials.items():
+        register(role, creds['email'], creds['phone'], creds['first_name'], creds['last_name'])
+
+    assert client.post('/login', json={'identifier': 'farmer@example.com', 'password': PASSWORD}).status_code == 200
+    assert client.post('/login', json={'identifier': '1111111111', 'password': PASSWORD}).status_code == 200
+    for user_id, route in enumerate(['/farmer', '/manufacturer', '/distributor', '/retailer'], start=1):
+        assert client.post(route, json={'user_id': user_id}).status_code == 200
+
+    assert client.post('/raw_material', json={
+        'user_id': 1, 'material_type': 'herb', 'quantity': 5, 'source_location': 'Farm', 'supply_date': '2024-01-01'
+    }).status_code == 200
+    assert client.get('/raw_materials').status_code == 200
+    assert client.post('/medicine', json={
+        'user_id': 2, 'raw_material_id': 1, 'medicine_name': 'Med', 'batch_number': 'B1',
+        'production_date': '2024-01-02', 'expiry_date': '2025-01-02'
+    }).status_code == 200
+    assert client.get('/medicines').status_code == 200
+    assert client.post('/distribution', json={
+        'user_id': 3, 'medicine_id': 1, 'shipment_date': '2024-01-03', 'transport_method': 'Truck',
+        'destination': 'City', 'storage_condition': 'Cool'
+    }).status_code == 200
+    assert client.get('/distributions').status_code == 200
+    assert client.post('/retail', json={
+        'user_id': 4, 'distribution_id': 1, 'received_date': '2024-01-04', 'price': 9.5, 'retail_location': 'Shop'
+    }).status_code == 200
+
+    assert client.get('/product_history/1?location=Pune').status_code == 200
+    assert client.get('/product_history/999').status_code == 404
+    client.current_endpoint[0] = 'scan_flush'
+    app_module.scan_buffer.flush()
+    assert client.get('/scan_stats/1').status_code == 200
+
+
+def test_every_route_query_uses_an_index(statements):
+    engine, captured = statements
+    endpoints = {rule.endpoint for rule in app_module.app.url_map.iter_rules()} - {'static'}
+    assert {endpoint for endpoint, _, _ in captured} >= endpoints
+
+    failures = []
+    with engine.connect() as conn:
+        for endpoint, statement, parameters in captured:
+            plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            scans = [
+                row[-1] for row in plan
+                if FULL_SCAN.match(row[-1]) and row[-1] != f"SCAN {LISTING_SCANS.get(endpoint)}"
+            ]
+            if scans:
+                failures.append(f"{endpoint}: {' | '.join(scans)}: {statement}")
+
+    assert not failures, 'Queries without an index:\n' + '\n'.join(failures)
+
+
+@pytest.mark.parametrize('detail, full_scan', [
+    ('SCAN medicine', True),
+    ('SCAN medicine USING INDEX ix_medicine_raw_material_id', False),
+    ('SCAN medicine USING COVERING INDEX ix_medicine_raw_material_id', False),
+    ('SEARCH medicine USING INDEX ix_medicine_raw_material_id (raw_material_id=?)', False),
+])
+def test_full_scan_pattern(detail, full_scan):
+    assert bool(FULL_SCAN.match(detail)) is full_scan
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import app as app_module
+
+PASSWORD = '12345678'
+
+
+def _register(client, email, phone):
+    return client.post('/register', json={
+        'first_name': 'farmer', 'last_name': 'farmer', 'email': email, 'phone': phone,
+        'password': PASSWORD, 'confirm_password': PASSWORD, 'role': 'Farmer'
+    })
+
+
+def test_duplicate_email_and_phone_are_reported_by_field():
+    client = app_module.app.test_client()
+    assert _register(client, 'phoneguy@example.com', '5550000001').status_code == 200
+
+    response = _register(client, 'phoneguy@example.com', '5550000002')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Email already exists'}
+
+    response = _register(client, 'someone@example.com', '5550000001')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Phone already exists'}
+
+
+@pytest.mark.parametrize('constraint, field', [('user_email_key', 'email'), ('user_phone_key', 'phone')])
+def test_postgres_constraint_name_decides_field(constraint, field):
+    # psycopg2 puts the duplicate value in the message, so a 'phone' email must not confuse it.
+    orig = Exception('duplicate key value violates unique constraint\n'
+                     'DETAIL:  Key (email)=(phoneguy@example.com) already exists.')
+    orig.diag = SimpleNamespace(constraint_name=constraint)
+    error = IntegrityError('INSERT INTO "user" ...', {}, orig)
+    assert app_module.duplicate_user_field(error) == field
+
+
+def test_login_falls_back_when_email_has_no_at_sign():
+    client = app_module.app.test_client()
+    assert _register(client, 'nophone', '5550000003').status_code == 200
+    for identifier in ['nophone', '5550000003']:
+        response = client.post('/login', json={'identifier': identifier, 'password': PASSWORD})
+        assert response.status_code == 200
@@ -0,0 +1,202 @@
+import logging
+import time
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import scan_telemetry
+import app as app_module
+from database import db
+from models import Medicine, RawMaterial, ScanAggregate, User
+from scan_telemetry import OVERFLOW_LOCATION, ScanBuffer
+
+DAY = date(2026, 3, 1)
+
+
+@pytest.fixture(scope='module')
+def medicine_ids():
+    with app_module.app.app_context():
+        user = User(first_name='scan', last_name='test', email='scan@example.com', phone='5559990000',
+                    password='x', role='Manufacturer')
+        db.session.add(user)
+        db.session.flush()
+        raw_material = RawMaterial(user_id=user.id, material_type='herb', quantity=1,
+                                   source_location='Farm', supply_date=DAY)
+        db.session.add(raw_material)
+        db.session.flush()
+        medicines = [
+            Medicine(user_id=user.id, raw_material_id=raw_material.id, medicine_name=f"Scan {i}",
+                     batch_number=f"S{i}", production_date=DAY, expiry_date=DAY)
+            for i in range(2)
+        ]
+        db.session.add_all(medicines)
+        db.session.commit()
+        return [m.id for m in medicines]
+
+
+class _Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def utcnow(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock(datetime(2026, 3, 1, 12, 0))
+    monkeypatch.setattr(scan_telemetry, 'datetime', clock)
+    return clock
+
+
+def _aggregates(medicine_id):
+    with app_module.app.app_context():
+        return {
+            (a.location, a.scan_date): (a.scan_count, a.first_scanned_at, a.last_scanned_at)
+            for a in ScanAggregate.query.filter_by(medicine_id=medicine_id)
+        }
+
+
+@pytest.fixture(autouse=True)
+def _no_exit_flush(monkeypatch):
+    # Buffers flush at interpreter exit; leftovers from these tests must not reach the database.
+    monkeypatch.setattr(scan_telemetry.atexit, 'register', lambda fn: None)
+
+
+def _buffer(**kwargs):
+    options = {'flush_size': 10 ** 6, 'flush_interval': 3600, 'max_pending': 100, 'max_locations': 50}
+    options.update(kwargs)
+    return ScanBuffer(app_module.app, **options)
+
+
+def test_flush_thread_survives_unexpected_errors(monkeypatch):
+    batches = []
+
+    def broken_upsert(rows):
+        batches.append(rows)
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(scan_telemetry, '_upsert', broken_upsert)
+    buffer = _buffer(flush_size=1)
+    buffer.record(1, 'pune')
+    thread = buffer._thread
+    _wait_for(lambda: len(batches) == 1)
+    buffer.record(1, 'delhi')
+    _wait_for(lambda: len(batches) == 2)
+
+    assert buffer._thread is thread and thread.is_alive()
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_scans_aggregate_by_medicine_location_and_day(medicine_ids, clock):
+    first, second = medicine_ids
+    buffer = _buffer()
+    buffer.record(first, 'Pune')
+    buffer.record(first, '  PUNE ')
+    buffer.record(second, 'Pune')
+    clock.now = datetime(2026, 3, 2, 9, 0)
+    buffer.record(first, 'Pune')
+    buffer.record(first, None)
+
+    assert {key: entry[0] for key, entry in buffer._pending.items()} == {
+        (first, 'pune', date(2026, 3, 1)): 2,
+        (second, 'pune', date(2026, 3, 1)): 1,
+        (first, 'pune', date(2026, 3, 2)): 1,
+        (first, 'unknown', date(2026, 3, 2)): 1,
+    }
+
+
+def test_locations_past_the_cap_fold_into_other(clock):
+    buffer = _buffer(max_locations=2)
+    for location in ['a', 'b', 'c', 'd', 'a']:
+        buffer.record(7, location)
+
+    assert {key[1]: entry[0] for key, entry in buffer._pending.items()} == {
+        'a': 2, 'b': 1, OVERFLOW_LOCATION: 2,
+    }
+
+
+def test_full_buffer_keeps_existing_keys_and_counts_drops(clock, caplog):
+    buffer = _buffer(max_pending=2)
+    buffer.record(1, 'a')
+    buffer.record(1, 'b')
+    buffer.record(1, 'a')
+    # New keys fold into the medicine's overflow bucket, which cannot be created while full.
+    buffer.record(2, 'x')
+    buffer.record(2, 'y')
+
+    assert {key[:2]: entry[0] for key, entry in buffer._pending.items()} == {(1, 'a'): 2, (1, 'b'): 1}
+    assert buffer.dropped == 2
+    assert buffer._wakeup.is_set()
+
+    buffer._pending = {}
+    with caplog.at_level(logging.WARNING, logger='scan_telemetry'):
+        buffer.flush()
+    assert buffer.dropped == 0
+    assert 'dropped 2 scans' in caplog.text
+
+
+def test_failed_flush_is_requeued(medicine_ids, clock, monkeypatch):
+    medicine_id = medicine_ids[0]
+    clock.now = datetime(2026, 3, 10, 8, 0)
+    buffer = _buffer()
+    buffer.record(medicine_id, 'nagpur')
+    buffer.record(medicine_id, 'nagpur')
+
+    real_upsert = scan_telemetry._upsert
+
+    def failing_upsert(rows):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(scan_telemetry, '_upsert', failing_upsert)
+    buffer.flush()
+    assert {key: entry[0] for key, entry in buffer._pending.items()} == {
+        (medicine_id, 'nagpur', date(2026, 3, 10)): 2,
+    }
+
+    monkeypatch.setattr(scan_telemetry, '_upsert', real_upsert)
+    buffer.flush()
+    assert buffer._pending == {}
+    assert _aggregates(medicine_id)[('nagpur', date(2026, 3, 10))][0] == 2
+
+
+def test_out_of_order_batches_keep_first_and_last_times(medicine_ids):
+    medicine_id = medicine_ids[1]
+    scan_date = date(2026, 3, 20)
+
+    def row(count, first, last):
+        return {
+            'medicine_id': medicine_id, 'location': 'mumbai', 'scan_date': scan_date, 'scan_count': count,
+            'first_scanned_at': datetime(2026, 3, 20, first), 'last_scanned_at': datetime(2026, 3, 20, last),
+        }
+
+    with app_module.app.app_context():
+        scan_telemetry._upsert([row(3, 10, 11)])
+        db.session.commit()
+        # An older batch from a slower worker lands afterwards.
+        scan_telemetry._upsert([row(2, 8, 9)])
+        db.session.commit()
+
+    assert _aggregates(medicine_id)[('mumbai', scan_date)] == (
+        5, datetime(2026, 3, 20, 8), datetime(2026, 3, 20, 11)
+    )
+
+
+def test_rows_rejected_by_constraints_are_discarded_not_requeued(medicine_ids, clock):
+    medicine_id = medicine_ids[0]
+    clock.now = datetime(2026, 3, 30, 8, 0)
+    buffer = _buffer()
+    buffer.record(medicine_id, 'chennai')
+    buffer.record(999999, 'chennai')
+
+    buffer.flush()
+
+    assert buffer._pending == {}
+    assert _aggregates(medicine_id)[('chennai', date(2026, 3, 30))][0] == 1
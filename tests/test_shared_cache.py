@@ -0,0 +1,170 @@
+import os
+import stat
+from datetime import date
+
+import pytest
+from flask import Flask
+
+import app as app_module
+import shared_cache
+from database import db
+from models import User
+from shared_cache import NullCache, SharedCache, init_cache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(shared_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedCache(str(tmp_path / 'cache.sqlite3'), namespace='test')
+
+
+def test_invalidation_during_load_blocks_stale_refill(cache):
+    def load_then_concurrent_write():
+        stale = ['raw material 1']
+        # Another worker commits a write and invalidates while this load is in flight.
+        cache.invalidate('raw_materials')
+        return stale
+
+    assert cache.get_or_set('raw_materials', load_then_concurrent_write) == ['raw material 1']
+    assert cache.get('raw_materials') is None
+    assert cache.get_or_set('raw_materials', lambda: []) == []
+    assert cache.get('raw_materials') == []
+
+
+def test_entries_expire_after_their_ttl(cache, clock):
+    cache.set('short', 1, ttl=5)
+    cache.set('default', 2)
+    clock.now += 5
+    assert cache.get('short') is None
+    assert cache.get('default') == 2
+    clock.now += cache.default_ttl
+    assert cache.get('default') is None
+
+
+def test_eviction_keeps_at_most_max_entries(tmp_path, clock):
+    cache = SharedCache(str(tmp_path / 'cache.sqlite3'), namespace='test', max_entries=3)
+    for i in range(5):
+        cache.set(f"k{i}", i, ttl=10 + i)
+
+    # The entries closest to expiry go first.
+    assert [cache.get(f"k{i}") for i in range(5)] == [None, None, 2, 3, 4]
+
+
+def test_namespaces_do_not_share_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    first, second = SharedCache(path, namespace='db1'), SharedCache(path, namespace='db2')
+    first.set('user:1', {'role': 'Farmer'})
+    second.set('user:1', {'role': 'Retailer'})
+    assert first.get('user:1') == {'role': 'Farmer'}
+
+    first.clear()
+    assert first.get('user:1') is None
+    assert second.get('user:1') == {'role': 'Retailer'}
+
+
+def test_init_cache_namespaces_by_database_uri(tmp_path, monkeypatch):
+    monkeypatch.setenv('SHARED_CACHE_PATH', str(tmp_path / 'cache.sqlite3'))
+    caches = []
+    for uri in ['sqlite:///one.db', 'sqlite:///two.db']:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = uri
+        caches.append(init_cache(app))
+    caches[0].set('raw_materials', [1])
+    assert caches[1].get('raw_materials') is None
+
+
+def test_default_directory_is_created_private(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache.tempfile, 'gettempdir', lambda: str(tmp_path))
+    path = shared_cache._private_cache_dir()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+
+
+def test_shared_default_directory_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache.tempfile, 'gettempdir', lambda: str(tmp_path))
+    monkeypatch.delenv('SHARED_CACHE_PATH', raising=False)
+    exposed = tmp_path / f"supply_chain_cache-{os.getuid()}"
+    exposed.mkdir()
+    exposed.chmod(0o777)
+
+    with pytest.raises(PermissionError):
+        shared_cache._private_cache_dir()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    assert isinstance(init_cache(app), NullCache)
+
+
+@pytest.fixture
+def supply_chain_users():
+    with app_module.app.app_context():
+        users = {
+            role: User(first_name=role, last_name='cache', email=f"{role.lower()}-cache@example.com",
+                       phone=f"555888000{i}", password='x', role=role)
+            for i, role in enumerate(['Farmer', 'Manufacturer', 'Distributor', 'Retailer'])
+        }
+        db.session.add_all(users.values())
+        db.session.commit()
+        return {role: user.id for role, user in users.items()}
+
+
+def test_write_endpoints_invalidate_what_they_change(supply_chain_users):
+    assert isinstance(app_module.cache, SharedCache)
+    client = app_module.app.test_client()
+    ids = supply_chain_users
+
+    def read(path):
+        response = client.get(path)
+        assert response.status_code == 200
+        return response.get_json()
+
+    def write(path, payload):
+        response = client.post(path, json=payload)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['id']
+
+    read('/raw_materials')
+    assert app_module.cache.get('raw_materials') is not None
+    raw_material_id = write('/raw_material', {
+        'user_id': ids['Farmer'], 'material_type': 'bark', 'quantity': 2,
+        'source_location': 'Farm', 'supply_date': date.today().isoformat()
+    })
+    assert raw_material_id in [m['id'] for m in read('/raw_materials')]
+
+    read('/medicines')
+    medicine_id = write('/medicine', {
+        'user_id': ids['Manufacturer'], 'raw_material_id': raw_material_id, 'medicine_name': 'Cached',
+        'batch_number': 'C1', 'production_date': '2024-01-01', 'expiry_date': '2025-01-01'
+    })
+    assert raw_material_id not in [m['id'] for m in read('/raw_materials')]
+    assert medicine_id in [m['id'] for m in read('/medicines')]
+    assert read(f"/product_history/{medicine_id}")['distributions'] == []
+
+    read('/distributions')
+    distribution_id = write('/distribution', {
+        'user_id': ids['Distributor'], 'medicine_id': medicine_id, 'shipment_date': '2024-02-01',
+        'transport_method': 'Truck', 'destination': 'City', 'storage_condition': 'Cool'
+    })
+    assert medicine_id not in [m['id'] for m in read('/medicines')]
+    assert distribution_id in [d['id'] for d in read('/distributions')]
+    assert len(read(f"/product_history/{medicine_id}")['distributions']) == 1
+    assert read(f"/product_history/{medicine_id}")['retail_sales'] == []
+
+    write('/retail', {
+        'user_id': ids['Retailer'], 'distribution_id': distribution_id, 'received_date': '2024-03-01',
+        'price': 4.5, 'retail_location': 'Shop'
+    })
+    assert distribution_id not in [d['id'] for d in read('/distributions')]
+    assert len(read(f"/product_history/{medicine_id}")['retail_sales']) == 1